@@ -1,17 +1,80 @@
+import atexit
+import functools
+import itertools
+import logging
 import os
+import re
+import shelve
+import shlex
+import subprocess
+from bisect import bisect_left, insort
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from enum import Enum
+from operator import attrgetter
 from pathlib import Path
+from threading import Lock
 from typing import Optional
 
 import typer
 from os import environ
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-headers = {"Authorization": f"ApiKey {environ['API_KEY']}"}
+logger = logging.getLogger(__name__)
 
-landscape_id = environ['LANDSCAPE_ID']
-version_id = environ['LANDSCAPE_VERSION']
+# Shared worker pool for concurrent API calls, sized to fit in the session's connection pool.
+# Tasks submitted to it must not submit further tasks and wait on them.
+EXECUTOR = ThreadPoolExecutor(max_workers=16)
+
+
+@dataclass(slots=True, frozen=True)
+class Config:
+    api_key: str
+    landscape_id: str
+    version_id: str
+
+    @property
+    def base_url(self):
+        return f"https://api.icepanel.io/v1/landscapes/{self.landscape_id}/versions/{self.version_id}"
+
+
+@functools.lru_cache(maxsize=1)
+def get_config():
+    """
+    Reads the IcePanel settings from the environment on first use rather than at import
+    :return:
+    """
+    return Config(environ['API_KEY'], environ['LANDSCAPE_ID'], environ['LANDSCAPE_VERSION'])
+
+
+@functools.lru_cache(maxsize=1)
+def get_session(api_key):
+    """
+    Shared session so every IcePanel call reuses pooled keep-alive connections
+    :param api_key:
+    :return:
+    """
+    session = requests.Session()
+    session.headers.update({"Authorization": f"ApiKey {api_key}"})
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32,
+                                          max_retries=Retry(total=3, backoff_factor=0.3,
+                                                            status_forcelist=[429, 500, 502, 503, 504],
+                                                            raise_on_status=False)))
+    return session
+
+
+# Characters kept when sanitizing, everything else is stripped
+NON_ID_CHARS = re.compile(r"\W")
+NON_FILENAME_CHARS = re.compile(r"[^\w .]")
+
+
+@functools.lru_cache(maxsize=4096)
+def mermaid_id(id):
+    return NON_ID_CHARS.sub("", id)
 
 
 class MermaidExportType(str, Enum):
@@ -19,22 +82,22 @@ class MermaidExportType(str, Enum):
     png = "png"
 
 
+@dataclass(slots=True, repr=False)
 class SequenceParticipant:
-    def __init__(self, id, name):
-        self.id = id
-        self.name = name
+    id: str
+    name: str
 
     def __repr__(self):
         return f"{self.id} - {self.name}"
 
 
+@dataclass(slots=True)
 class SequenceInteraction:
-    def __init__(self, id, type, description, source_id, target_id):
-        self.id = id
-        self.type = type
-        self.description = description
-        self.source_id = source_id
-        self.target_id = target_id
+    id: str
+    type: str
+    description: str
+    source_id: str
+    target_id: Optional[str]
 
     def __str__(self):
         return f"{self.id} - {self.type} - {self.description} - {self.source_id} - {self.target_id}"
@@ -61,68 +124,116 @@ class MermaidSequence:
         return self.name
 
     def generate(self):
-        graph_data = "sequenceDiagram\n"
-        graph_data += f"\tautonumber\n"
+        parts = ["sequenceDiagram\n", "\tautonumber\n"]
         for participant in self.participants.values():
-            graph_data += f"\tparticipant {participant.id} as {participant.name}\n"
+            parts.append(f"\tparticipant {participant.id} as {participant.name}\n")
         for sequence_step in self.sequence_steps:
             if sequence_step.target_id is None:
-                graph_data += f"\t{sequence_step.source_id} -->> {sequence_step.source_id}: {sequence_step.description}\n"
+                parts.append(f"\t{sequence_step.source_id} -->> {sequence_step.source_id}: {sequence_step.description}\n")
             else:
-                graph_data += f"\t{sequence_step.source_id} ->> {sequence_step.target_id}: {sequence_step.description}\n"
-        return graph_data
+                parts.append(f"\t{sequence_step.source_id} ->> {sequence_step.target_id}: {sequence_step.description}\n")
+        return "".join(parts)
+
+
+@dataclass(slots=True, eq=False)
+class Node:
+    id: str
+    name: str
+    parent: Optional[str]
+    # Position of the node's first add, sibling lists are kept sorted by it
+    order: int
+    children: list = field(default_factory=list)
+
+
+node_order = attrgetter("order")
+
+
+def insert_node(nodes, node):
+    insort(nodes, node, key=node_order)
+
+
+def remove_node(nodes, node):
+    del nodes[bisect_left(nodes, node.order, key=node_order)]
 
 
 class MermaidDiagram:
     def __init__(self, name):
         self.name = name
         self.nodes = {}
+        # Nesting is maintained as nodes are added: top level nodes, plus the ids of
+        # nodes whose parent has not been added yet (rendered as roots until it is)
+        self.roots = []
+        self.pending_by_parent = {}
         self.links = []
+        # Rendered output, reset whenever the diagram changes
+        self.rendered = None
 
     def add_node(self, id, name, parent_id=None):
+        self.rendered = None
         # Sanitize ID and Name for mermaid
-        safe_id = "".join(c for c in id if c.isalnum() or c in ('_',))
+        safe_id = mermaid_id(id)
         # Escape quotes in name
         safe_name = name.replace('"', '&quot;')
-        self.nodes[id] = {
-            "id": safe_id, 
-            "name": safe_name, 
-            "parent": parent_id,
-            "children": []
-        }
+        node = self.nodes.get(id)
+        if node is None:
+            node = Node(id=safe_id, name=safe_name, parent=parent_id, order=len(self.nodes))
+            self.nodes[id] = node
+            # Adopt nodes added earlier that were waiting for this parent
+            for child_id in self.pending_by_parent.pop(id, ()):
+                child = self.nodes[child_id]
+                remove_node(self.roots, child)
+                insert_node(node.children, child)
+            self._attach(id, node)
+        else:
+            # Re-adding a node updates it in place, keeping its children and its position
+            node.id = safe_id
+            node.name = safe_name
+            if node.parent != parent_id:
+                self._detach(id, node)
+                node.parent = parent_id
+                self._attach(id, node)
+
+    def _is_nested(self, node):
+        return bool(node.parent) and node.parent in self.nodes
+
+    def _attach(self, id, node):
+        if self._is_nested(node):
+            insert_node(self.nodes[node.parent].children, node)
+        else:
+            insert_node(self.roots, node)
+            if node.parent:
+                self.pending_by_parent.setdefault(node.parent, []).append(id)
+
+    def _detach(self, id, node):
+        if self._is_nested(node):
+            remove_node(self.nodes[node.parent].children, node)
+        else:
+            remove_node(self.roots, node)
+            if node.parent:
+                self.pending_by_parent[node.parent].remove(id)
 
     def add_link(self, source_id, target_id, label=None):
+        self.rendered = None
         self.links.append({"source": source_id, "target": target_id, "label": label})
 
     def generate(self):
-        # Pre-process nesting only for generation
-        # Reset children to avoid duplicates if generated multiple times
-        for node in self.nodes.values():
-            node["children"] = []
-
-        roots = []
-        for node_id, node in self.nodes.items():
-            if node["parent"] and node["parent"] in self.nodes:
-                self.nodes[node["parent"]]["children"].append(node)
-            else:
-                roots.append(node)
+        if self.rendered is not None:
+            return self.rendered
 
-        graph_data = "flowchart TD\n"
+        parts = ["flowchart TD\n"]
         
         def render_node(node, indent=1):
-            s = ""
             tab = "\t" * indent
-            if node["children"]:
-                s += f"{tab}subgraph {node['id']} [\"{node['name']}\"]\n"
-                for child in node["children"]:
-                    s += render_node(child, indent + 1)
-                s += f"{tab}end\n"
+            if node.children:
+                parts.append(f"{tab}subgraph {node.id} [\"{node.name}\"]\n")
+                for child in node.children:
+                    render_node(child, indent + 1)
+                parts.append(f"{tab}end\n")
             else:
-                s += f"{tab}{node['id']}[\"{node['name']}\"]\n"
-            return s
+                parts.append(f"{tab}{node.id}[\"{node.name}\"]\n")
 
-        for root in roots:
-            graph_data += render_node(root)
+        for root in self.roots:
+            render_node(root)
             
         for link in self.links:
             source = self.nodes.get(link['source'])
@@ -130,29 +241,89 @@ class MermaidDiagram:
             if source and target:
                 arrow = "-->"
                 if link['label']:
-                    graph_data += f"\t{source['id']} {arrow}|{link['label']}| {target['id']}\n"
+                    parts.append(f"\t{source.id} {arrow}|{link['label']}| {target.id}\n")
                 else:
-                    graph_data += f"\t{source['id']} {arrow} {target['id']}\n"
-        return graph_data
+                    parts.append(f"\t{source.id} {arrow} {target.id}\n")
+        self.rendered = "".join(parts)
+        return self.rendered
 
 
+# In-process caches keyed by (config, id) since ids are shared across versions of a landscape
 model_objects = {}
 # Cache diagrams by diagram_id instead of object_id to avoid redundant fetches
 diagram_cache = {}
+# Guards cache inserts since objects are prefetched from worker threads
+cache_lock = Lock()
+# Disk-backed cache of API responses shared across runs, opened by main() unless --no-cache is given
+disk_cache = None
+# Statuses worth remembering: found, and definitely not there (e.g. a sub-resource guess that doesn't exist)
+CACHEABLE_STATUS_CODES = (200, 404)
+
+
+def cache_key(object_id):
+    config = get_config()
+    return f"{config.landscape_id}:{config.version_id}:{object_id}"
+
+
+def cached_fetch(object_id, url):
+    """
+    GETs url and decodes its json body, memoizing found and not found responses in the disk cache.
+    Entries of a pinned landscape version are served as is, 'latest' ones are revalidated
+    with a conditional GET so an unchanged resource comes back as a bodiless 304.
+    :param object_id: cache key suffix identifying the resource
+    :param url:
+    :return: status code and decoded body
+    """
+    key = cache_key(object_id)
+    entry = None
+    if disk_cache is not None:
+        with cache_lock:
+            entry = disk_cache.get(key)
+    if entry is not None and get_config().version_id != "latest":
+        return entry["status_code"], entry["data"]
+
+    conditional_headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            conditional_headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            conditional_headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = get_session(get_config().api_key).get(url, headers=conditional_headers)
+    if response.status_code == 304 and entry is not None:
+        return entry["status_code"], entry["data"]
+
+    decoded = True
+    try:
+        data = orjson.loads(response.content)
+    except ValueError:
+        data = {}
+        decoded = False
+
+    if response.status_code in CACHEABLE_STATUS_CODES and decoded and disk_cache is not None:
+        with cache_lock:
+            disk_cache[key] = {
+                "status_code": response.status_code,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "data": data
+            }
+            disk_cache.sync()
+    return response.status_code, data
 
 
 def get_model_object(model_object_id):
-    if model_object_id in model_objects:
-        return model_objects[model_object_id]
+    key = (get_config(), model_object_id)
+    if key in model_objects:
+        return model_objects[key]
     
     # Check if model_object_id is None to avoid unnecessary 404s
     if model_object_id is None:
         return {"id": None, "name": "Unknown", "type": "unknown"}
 
-    rmodel = requests.get(
-        f"https://api.icepanel.io/v1/landscapes/{landscape_id}/versions/{version_id}/model/objects/{model_object_id}",
-        headers=headers)
-    model_object = rmodel.json()
+    _, model_object = cached_fetch(
+        f"model/objects/{model_object_id}",
+        f"{get_config().base_url}/model/objects/{model_object_id}")
     if "modelObject" in model_object:
         model_object = model_object["modelObject"]
     elif "id" not in model_object:
@@ -161,101 +332,108 @@ def get_model_object(model_object_id):
         # Create a dummy object to allow continuity
         model_object = {"id": model_object_id, "name": "Unknown Model Object", "type": "unknown"}
     
-    model_objects[model_object_id] = model_object
+    with cache_lock:
+        model_objects[key] = model_object
     return model_object
 
 
+def prefetch_all_model_objects():
+    """
+    Loads every model object of the landscape version with a single list call so that
+    get_model_object is served from memory. On failure get_model_object falls back to per-id fetches.
+    :return:
+    """
+    status_code, data = cached_fetch(
+        "model/objects",
+        f"{get_config().base_url}/model/objects")
+    if status_code != 200:
+        print(f"Warning: Failed to list model objects ({status_code}), fetching them one by one")
+        return
+
+    config = get_config()
+    with cache_lock:
+        for model_object in data.get("modelObjects", []):
+            model_objects[(config, model_object["id"])] = model_object
+
+
+
+# Key paths probed, in order, to locate a diagram's objects and relationships in an API response
+OBJECT_PATHS = [("diagram", "objects"), ("diagramContent", "objects"), ("objects",), ("elements",)]
+RELATIONSHIP_PATHS = [("diagram", "relationships"), ("diagramContent", "relationships"), ("relationships",)]
+# Diagram sub-resources tried when the main response lacks objects or relationships.
+# /content usually has both, the remaining guesses are only fetched (concurrently) when it falls short
+SUB_RESOURCES = ["/content", "/objects", "/elements", "/relationships"]
+
+
+def dig(data, paths, types):
+    """
+    Walks each key path into data and returns the first non-empty value of the given types found
+    :param data:
+    :param paths:
+    :param types: accepted type or tuple of types, as for isinstance
+    :return:
+    """
+    for path in paths:
+        value = data
+        for key in path:
+            if not isinstance(value, dict):
+                value = None
+                break
+            value = value.get(key)
+        if value and isinstance(value, types):
+            return value
+    return None
+
 
 def get_diagram_data(diagram_id):
     # Check cache by diagram_id first
-    if diagram_id in diagram_cache:
-        return diagram_cache[diagram_id]
+    key = (get_config(), diagram_id)
+    if key in diagram_cache:
+        return diagram_cache[key]
         
     print(f"Fetching diagram [{diagram_id}] from API")
-    url = f"https://api.icepanel.io/v1/landscapes/{landscape_id}/versions/{version_id}/diagrams/{diagram_id}"
+    url = f"{get_config().base_url}/diagrams/{diagram_id}"
     
     # 1. Fetch main Diagram Metadata
-    rdia = requests.get(url, headers=headers)
-    if rdia.status_code != 200:
-        print(f"Error fetching diagram: {rdia.status_code}")
+    status_code, response_json = cached_fetch(f"diagrams/{diagram_id}", url)
+    if status_code != 200:
+        print(f"Error fetching diagram: {status_code}")
         return None
     
-    response_json = rdia.json()
     dia = response_json.get("diagram", {})
     
     # 2. Strategy: Attempt to find 'objects' and 'relationships' map
-    objects = dia.get("objects")
-    relationships = dia.get("relationships", [])
+    objects = dig(response_json, OBJECT_PATHS, dict)
+    relationships = dig(response_json, RELATIONSHIP_PATHS, (list, dict))
     
-    if not objects and "diagramContent" in response_json:
-        objects = response_json["diagramContent"].get("objects")
-    if not relationships and "diagramContent" in response_json:
-        relationships = response_json["diagramContent"].get("relationships")
-    
-    if not objects or not relationships:
-        sub_resources = {
-            "/content": ["diagramContent", "objects"], 
-            "/objects": ["objects"],                   
-            "/elements": ["elements"],
-            "/relationships": ["relationships"]
-        }
-
-        for suffix, keys in sub_resources.items():
-            print(f"DEBUG: Fetching sub-resource {suffix}")
-            r_sub = requests.get(f"{url}{suffix}", headers=headers)
-            if r_sub.status_code == 200:
-                data = r_sub.json()
-                
-                # Check for relationships in common locations
-                if not relationships:
-                     if "diagramContent" in data and isinstance(data["diagramContent"], dict):
-                         relationships = data["diagramContent"].get("relationships", [])
-                         if relationships: print(f"DEBUG: Found {len(relationships)} relationships in diagramContent")
-                         else: print(f"DEBUG: diagramContent present but no relationships")
-                     elif "relationships" in data:
-                         relationships = data["relationships"]
-                         if relationships: print(f"DEBUG: Found {len(relationships)} relationships in root")
-                     elif isinstance(data, list):
-                         # Maybe the response IS the list of relationships? (unlikely for objects but possible for specific endpoints)
-                         pass
-                     else:
-                         print(f"DEBUG: No relationships found in root or diagramContent for {suffix}")
-                 
-                if suffix == "/relationships":
-                    # Specific handling if we added a new endpoint guess
-                    if isinstance(data, list):
-                        relationships = data
-                    elif isinstance(data, dict):
-                         if "relationships" in data:
-                             relationships = data["relationships"]
-                         else:
-                             # Maybe the dict values are relationships?
-                             pass
-
-                temp_obj = data
-                valid_path = True
-                
-                # Logic to drill down to objects
-                for key in keys:
-                    if isinstance(temp_obj, dict) and key in temp_obj:
-                        temp_obj = temp_obj[key]
-                    elif isinstance(temp_obj, dict) and key == "objects" and "objects" not in temp_obj:
-                            pass 
-                    else:
-                        valid_path = False
-                        break
-                
-                if valid_path and isinstance(temp_obj, dict) and temp_obj:
-                    if not objects:
-                        objects = temp_obj
-                
-                if suffix == "/objects" and not objects and isinstance(data, dict):
-                        objects = data
-                        if not relationships and "relationships" in data:
-                            relationships = data["relationships"]
-                
-                if objects and relationships:
-                    break
+    for suffixes in (SUB_RESOURCES[:1], SUB_RESOURCES[1:]):
+        if objects and relationships:
+            break
+
+        logger.debug("Fetching sub-resources %s", suffixes)
+        responses = EXECUTOR.map(
+            lambda suffix: cached_fetch(f"diagrams/{diagram_id}{suffix}", f"{url}{suffix}"), suffixes)
+
+        for suffix, (status_code, data) in zip(suffixes, responses):
+            if status_code != 200:
+                continue
+
+            if isinstance(data, list):
+                # The response may be the list of relationships itself
+                if suffix == "/relationships" and not relationships:
+                    relationships = data
+                continue
+
+            if not objects:
+                objects = dig(data, OBJECT_PATHS, dict)
+                if not objects and suffix == "/objects":
+                    # The response may be the objects map itself
+                    objects = data or None
+            if not relationships:
+                relationships = dig(data, RELATIONSHIP_PATHS, (list, dict))
+
+            if objects and relationships:
+                break
     
     # Final cleanup of relationships to ensure it's a list
     if relationships and isinstance(relationships, dict):
@@ -271,7 +449,9 @@ def get_diagram_data(diagram_id):
         dia["relationships"] = []
     else:
         dia["relationships"] = relationships
-            
+
+    with cache_lock:
+        diagram_cache[key] = dia
     return dia
 
 
@@ -293,22 +473,42 @@ def get_diagram_object(diagram_id, object_id):
 
 
 
+# Name -> id indexes of flows and diagrams keyed by (config, resource), only successful list calls are stored
+name_indexes = {}
+
+
+def get_name_index(resource):
+    """
+    Fetches all flows or diagrams once per configuration and indexes their ids by name
+    :param resource: "flows" or "diagrams"
+    :return: dict of name -> id, the first entry wins on duplicate names. None if the list call failed
+    """
+    config = get_config()
+    key = (config, resource)
+    if key in name_indexes:
+        return name_indexes[key]
+
+    status_code, data = cached_fetch(resource, f"{config.base_url}/{resource}")
+    if status_code != 200 or resource not in data:
+        print(f"Warning: Failed to list {resource} ({status_code})")
+        return None
+
+    index = {}
+    for item in data[resource]:
+        index.setdefault(item["name"], item["id"])
+    with cache_lock:
+        name_indexes[key] = index
+    return index
+
+
 def find_flow_by_name(name):
     """
     For given flow name finds its id
     :param name:
     :return:
     """
-    rflow = requests.get(
-        f"https://api.icepanel.io/v1/landscapes/{landscape_id}/versions/{version_id}/flows",
-        headers=headers)
-
-    # {{baseUrl}}/landscapes/:landscapeId/versions/:versionId/flows/:flowId
-    flows = rflow.json()["flows"]
-    for flow in flows:
-        if flow["name"] == name:
-            return flow["id"]
-    return None
+    index = get_name_index("flows")
+    return index.get(name) if index is not None else None
 
 
 def find_diagram_by_name(name):
@@ -317,23 +517,12 @@ def find_diagram_by_name(name):
     :param name:
     :return:
     """
-    rdiagrams = requests.get(
-        f"https://api.icepanel.io/v1/landscapes/{landscape_id}/versions/{version_id}/diagrams",
-        headers=headers)
-    
-    if rdiagrams.status_code != 200:
-        return None
-
-    diagrams = rdiagrams.json().get("diagrams", [])
-    for d in diagrams:
-        if d["name"] == name:
-            return d["id"]
-    return None
+    index = get_name_index("diagrams")
+    return index.get(name) if index is not None else None
 
 
 def create_file_name(filename, extension):
-    keepcharacters = (' ', '.', '_')
-    safe_filename = "".join(c for c in filename if c.isalnum() or c in keepcharacters).rstrip()
+    safe_filename = NON_FILENAME_CHARS.sub("", filename).rstrip()
     return f"{safe_filename}.{extension}"
 
 
@@ -344,13 +533,25 @@ def main(flow_name: Optional[str] = typer.Option(None, help="The name of the flo
                                       help="Converts the generated sequence to supported output format. Requires MMDC_CMD environment variable to be set to the path of mermaid executable"),
          data_dir: Path = typer.Option("data/", "--data-dir", "-d",
                                        help="Path where to store the generated sequence diagram"),
+         no_cache: bool = typer.Option(False, "--no-cache",
+                                       help="Bypasses the on-disk cache of IcePanel API responses kept in the data directory"),
+         verbose: bool = typer.Option(False, "--verbose", "-v", help="Prints debug output"),
          ):
+    global disk_cache
+
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.WARNING, format="%(levelname)s: %(message)s")
+
+    if not no_cache:
+        os.makedirs(data_dir, exist_ok=True)
+        disk_cache = shelve.open(str(Path(data_dir, ".icepanel_cache.db")))
+        atexit.register(disk_cache.close)
     
     if diagram_name:
         dia_id = find_diagram_by_name(diagram_name)
         if dia_id is None:
             typer.secho(f"Unable to find diagram [{diagram_name}]", fg=typer.colors.RED)
             return
+        prefetch_all_model_objects()
 
         dia = get_diagram_data(dia_id)
         if not dia:
@@ -362,28 +563,33 @@ def main(flow_name: Optional[str] = typer.Option(None, help="The name of the flo
              
         mdia = MermaidDiagram(diagram_name)
         
-        # First pass: Build a map of diagram_id -> model_id
-        dia_to_model = {}
-        if objects:
-             for obj_id, obj_data in objects.items():
-                  if obj_data.get("modelId"):
-                      dia_to_model[obj_id] = obj_data["modelId"]
+        # Single pass: build a map of model_id -> diagram_id (the first diagram object wins if a
+        # model appears twice) and split objects into groups (no modelId) and model objects so
+        # that groups are processed first
+        model_to_dia = {}
+        groups = []
+        models = []
+        for obj_id, obj_data in objects.items():
+             if obj_data.get("modelId"):
+                 model_to_dia.setdefault(obj_data["modelId"], obj_id)
+                 models.append((obj_id, obj_data))
+             else:
+                 groups.append((obj_id, obj_data))
                       
-        print(f"DEBUG: Found {len(objects)} objects")
+        logger.debug("Found %d objects", len(objects))
         
         # Strategy 3: if diagram relationships are empty, fetch ALL model connections and filter?
         # A bit inefficient but standard API seems to hide them for some reason
-        if not relationships:
-             print("DEBUG: Fetching all model connections as fallback strategy")
-             r_conns = requests.get(
-                f"https://api.icepanel.io/v1/landscapes/{landscape_id}/versions/{version_id}/model/connections",
-                headers=headers)
+        # Nothing to match against when no diagram object maps to a model object
+        if not relationships and model_to_dia:
+             logger.debug("Fetching all model connections as fallback strategy")
+             r_conns = get_session(get_config().api_key).get(
+                 f"{get_config().base_url}/model/connections")
              if r_conns.status_code == 200:
-                  all_conns = r_conns.json().get("modelConnections", [])
-                  print(f"DEBUG: Found {len(all_conns)} total model connections")
+                  all_conns = orjson.loads(r_conns.content).get("modelConnections", [])
+                  logger.debug("Found %d total model connections", len(all_conns))
                   
                   # Filter connections that are relevant to the objects in this diagram
-                  diagram_model_ids = set(dia_to_model.values())
                   
                   # We need to map model relationship back to diagram relationship if possible, 
                   # or just draw the link between model objects if both exist in diagram.
@@ -392,45 +598,23 @@ def main(flow_name: Optional[str] = typer.Option(None, help="The name of the flo
                        source_model = conn.get("originId") or conn.get("sourceId")
                        target_model = conn.get("targetId") or conn.get("destinationId")
 
-                       if source_model in diagram_model_ids and target_model in diagram_model_ids:
-                            # It's a candidate! But is it VISIBLE in this diagram?
-                            # conn['diagrams'] might tell us?
-                            # Documentation says "diagrams": {} 
-                            dia_keys = conn.get("diagrams", {}).keys()
-                            
-                            # If diagram_id is in the keys, it's definitely in.
-                            # Even if not, if both ends are in the diagram, it usually implies a connection in 
-                            # C4 unless explicitly hidden.
-                            
-                            # Even if not, if both ends are in the diagram, it usually implies a connection in 
-                            # C4 unless explicitly hidden.
-                            if dia_id in dia_keys or (source_model in diagram_model_ids and target_model in diagram_model_ids):
-                                 relationships.append({
-                                      "sourceId": [k for k,v in dia_to_model.items() if v == source_model][0], # Reverse lookup, risky if duplicates
-                                      "targetId": [k for k,v in dia_to_model.items() if v == target_model][0],
-                                      "label": conn.get("name"),
-                                      "modelId": conn.get("id")
-                                 })
-                  print(f"DEBUG: Deduced {len(relationships)} relationships from model connections")
-
-        print(f"DEBUG: Found {len(relationships)} relationships")
-        
-        # DEBUG: if 0 relationships, maybe they are embedded in objects? (Links?)
-        if len(relationships) == 0:
-            print("DEBUG: Checking objects for embedded links/relationships...")
-            for obj_id, obj_data in objects.items():
-                # Inspect object structure for clues
-                # print(f"DEBUG: Object {obj_id} keys: {obj_data.keys()}")
-                pass
+                       # If both ends are in the diagram, it usually implies a connection in
+                       # C4 unless explicitly hidden, whether or not conn['diagrams'] lists this diagram.
+                       if source_model in model_to_dia and target_model in model_to_dia:
+                            relationships.append({
+                                 "sourceId": model_to_dia[source_model],
+                                 "targetId": model_to_dia[target_model],
+                                 "label": conn.get("name"),
+                                 "modelId": conn.get("id")
+                            })
+                  logger.debug("Deduced %d relationships from model connections", len(relationships))
+
+        logger.debug("Found %d relationships", len(relationships))
 
         # Parse nodes and hierarchy - ensure non-model parents (groups) are processed
         
-        # Sort objects to potentially process parents (groups) before children if possible
-        # Simple heuristic: objects without modelId are likely groups (0), models are (1)
-        
-        sorted_items = sorted(objects.items(), key=lambda item: 1 if item[1].get("modelId") else 0)
-
-        for obj_id, obj_data in sorted_items:
+        # Process groups before model objects so parents are likely added before their children
+        for obj_id, obj_data in itertools.chain(groups, models):
              model_id = obj_data.get("modelId")
              parent_dia_id = obj_data.get("parentId")
              
@@ -442,11 +626,8 @@ def main(flow_name: Optional[str] = typer.Option(None, help="The name of the flo
                  
                  # Fallback: Check if the model object itself has a parent defined (Structural parent)
                  if not final_parent_id and "parentId" in model_obj:
-                     p_struct = model_obj["parentId"]
                      # Find diagram ID for this model parent
-                     candidates = [k for k,v in dia_to_model.items() if v == p_struct]
-                     if candidates:
-                         final_parent_id = candidates[0]
+                     final_parent_id = model_to_dia.get(model_obj["parentId"], final_parent_id)
 
                  # Ensure parent exists if not yet added
                  if final_parent_id and final_parent_id not in mdia.nodes:
@@ -494,17 +675,17 @@ def main(flow_name: Optional[str] = typer.Option(None, help="The name of the flo
              if (source_id in objects or source_id in mdia.nodes) and (target_id in objects or target_id in mdia.nodes):
                  mdia.add_link(source_id, target_id, label)
 
-        print(mdia.generate())
+        rendered = mdia.generate()
+        print(rendered)
         
         os.makedirs(data_dir, exist_ok=True)
-        filename = create_file_name(diagram_name, 'mmd')
-        f = open(f"{data_dir}/{filename}", "w")
-        f.write(mdia.generate())
-        f.close()
+        in_path = Path(data_dir, create_file_name(diagram_name, 'mmd'))
+        in_path.write_text(rendered, encoding="utf-8")
         
         if convert:
-            os.system(
-            f"{environ['MMDC_CMD']} -p puppeteer-config.json -i \"{data_dir}/{filename}\" -o \"{data_dir}/{create_file_name(diagram_name, export_type.value)}\"")
+            out_path = Path(data_dir, create_file_name(diagram_name, export_type.value))
+            subprocess.run([*shlex.split(environ['MMDC_CMD']), "-p", "puppeteer-config.json",
+                            "-i", str(in_path), "-o", str(out_path)], check=False)
         return
 
     if flow_name is None:
@@ -516,25 +697,44 @@ def main(flow_name: Optional[str] = typer.Option(None, help="The name of the flo
         # TODO add debug info (e.g. http call info)
         typer.secho(f"Unable to find flow [{flow_name}]", fg=typer.colors.RED)
         return
-    rflow = requests.get(
-        f"https://api.icepanel.io/v1/landscapes/{landscape_id}/versions/{version_id}/flows/{flow_id}",
-        headers=headers)
-
-    # print(rflow.json())
-    if rflow.status_code != 200 or "flow" not in rflow.json():
-        typer.secho(f"Unable to find flow [{rflow.json()}]", fg=typer.colors.RED)
+    prefetch_all_model_objects()
+    rflow = get_session(get_config().api_key).get(
+        f"{get_config().base_url}/flows/{flow_id}")
+
+    # print(rflow.content)
+    flow_json = orjson.loads(rflow.content) if rflow.status_code == 200 else {}
+    if "flow" not in flow_json:
+        typer.secho(f"Unable to find flow [{rflow.text}]", fg=typer.colors.RED)
         return
-    flow = rflow.json()["flow"]
+    flow = flow_json["flow"]
     seq = MermaidSequence(flow["name"])
     steps = {k: v for k, v in sorted(flow["steps"].items(), key=lambda item: item[1]["index"])}
 
+    dia = get_diagram_data(flow["diagramId"])
+    if not dia:
+        typer.secho("Unable to fetch diagram data", fg=typer.colors.RED)
+        return
+    dia_objects = dia["objects"]
+
+    # Prefetch the model objects of every step concurrently so the loop below only hits the cache
+    model_ids = set()
+    for v in steps.values():
+        for object_id in (v["originId"], v["targetId"]):
+            if object_id in dia_objects and dia_objects[object_id].get("modelId"):
+                model_ids.add(dia_objects[object_id]["modelId"])
+    list(EXECUTOR.map(get_model_object, model_ids))
+
     for k, v in steps.items():
-        dia_obj_ori = get_diagram_object(flow["diagramId"], v["originId"])
+        dia_obj_ori = dia_objects.get(v["originId"])
         if dia_obj_ori is None:
             print(f"Skipping step {k} because origin object {v['originId']} could not be found.")
             continue
             
-        dia_obj_tar = get_diagram_object(flow["diagramId"], v["targetId"]) if v["targetId"] is not None else None
+        dia_obj_tar = None
+        if v["targetId"] is not None:
+            dia_obj_tar = dia_objects.get(v["targetId"])
+            if dia_obj_tar is None:
+                print(f"Error: Object {v['targetId']} not found in diagram {flow['diagramId']}")
         
         model_obj_ori = get_model_object(dia_obj_ori["modelId"])
         model_obj_tar = None
@@ -550,17 +750,18 @@ def main(flow_name: Optional[str] = typer.Option(None, help="The name of the flo
                                           participant_tar.id if participant_tar is not None else None)
         # print(f"{k}: {v['description']} - {v['type']} - {model_obj_ori['name']}")
         seq.add_sequence_step(interaction)
-    print(seq.generate())
+    rendered = seq.generate()
+    print(rendered)
     
     # Ensure data directory exists
     os.makedirs(data_dir, exist_ok=True)
     
-    f = open(f"{data_dir}/{create_file_name(flow_name, 'mmd')}", "w")
-    f.write(seq.generate())
-    f.close()
+    in_path = Path(data_dir, create_file_name(flow_name, 'mmd'))
+    in_path.write_text(rendered, encoding="utf-8")
     if convert:
-        os.system(
-            f"{environ['MMDC_CMD']} -p puppeteer-config.json -i \"{data_dir}/{create_file_name(flow_name, 'mmd')}\" -o \"{data_dir}/{create_file_name(flow_name, export_type.value)}\"")  # -b transparent
+        out_path = Path(data_dir, create_file_name(flow_name, export_type.value))
+        subprocess.run([*shlex.split(environ['MMDC_CMD']), "-p", "puppeteer-config.json",
+                        "-i", str(in_path), "-o", str(out_path)], check=False)  # -b transparent
 
 
 # Press the green button in the gutter to run the script.